@@ -2,147 +2,272 @@
 # -*- coding: utf-8 -*-
 
 import os
-import glob
 import time
-import datetime
+import errno
+import asyncio
+import subprocess
 import logging
-from minimalmodbus import Instrument
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from modbus_writer import ModbusRTUWriter, setup_logging, sleep_until_next
+
+class ReadStatus(Enum):
+    """Результат чтения датчика"""
+    OK = 'ok'                # Данные получены
+    MISSING = 'missing'      # Датчик отключен - повторять чтение бессмысленно
+    TRANSIENT = 'transient'  # Сбой на шине - можно повторить
+    FAILED = 'failed'        # Неожиданная ошибка (например, нет прав) - повтор не поможет
 
 class DS18B20:
-    def __init__(self):
-        # Настройка интерфейса 1-Wire
-        os.system('modprobe w1-gpio')
-        os.system('modprobe w1-therm')
-        
+    def __init__(self, rescan_interval=60):
         # Базовая директория для устройств 1-Wire
         self.base_dir = '/sys/bus/w1/devices/'
         
+        # Список датчиков кэшируется и обновляется при ошибке чтения, когда список пуст,
+        # и раз в rescan_interval секунд - чтобы найти вернувшиеся и новые датчики
+        self.rescan_interval = rescan_interval
+        self._sensors = []
+        self._device_files = {}
+        self._last_scan = 0.0
+        self._rescan_needed = False
+        
+        # Последняя неожиданная ошибка по каждому датчику - чтобы не повторять её в логе каждый цикл
+        self._sensor_errors = {}
+        
+        # Модули 1-Wire загружаем, только если датчики не видны
+        if not self.refresh_sensors() and self._ensure_modules():
+            self.refresh_sensors()
+    
+    @staticmethod
+    def _ensure_modules():
+        """Загрузка модулей ядра 1-Wire, если они ещё не загружены"""
+        try:
+            with open('/proc/modules') as f:
+                loaded = {line.split(' ', 1)[0] for line in f}
+        except OSError:
+            loaded = set()
+        
+        needed = [module for module in ('w1_gpio', 'w1_therm') if module not in loaded]
+        for module in needed:
+            try:
+                subprocess.run(['modprobe', module.replace('_', '-')], check=False)
+            except OSError as e:
+                logging.error("Не удалось загрузить модуль %s: %s", module, e)
+        
+        return bool(needed)
+    
+    @property
+    def sensors(self):
+        """Список найденных датчиков"""
+        return list(self._sensors)
+    
     def find_sensors(self):
         """Поиск всех подключенных датчиков DS18B20"""
-        device_folders = glob.glob(self.base_dir + '28*')
-        sensors = []
-        
-        for folder in device_folders:
-            sensor_id = folder.split('/')[-1]
-            sensors.append(sensor_id)
+        try:
+            with os.scandir(self.base_dir) as entries:
+                # Порядок scandir произвольный - сортируем, чтобы номер датчика (и его регистр) был постоянным
+                return sorted(entry.name for entry in entries if entry.name.startswith('28'))
+        except OSError:
+            return []
+    
+    def refresh_sensors(self):
+        """Повторный поиск датчиков и обновление кэша"""
+        self._sensors = self.find_sensors()
+        self._last_scan = time.monotonic()
+        self._rescan_needed = False
         
-        return sensors
+        # Полные пути к файлам датчиков собираем один раз, а не при каждом чтении
+        self._device_files = {
+            sensor_id: os.path.join(self.base_dir, sensor_id, 'temperature')
+            for sensor_id in self._sensors
+        }
+        return self.sensors
+    
+    def rescan_due(self):
+        """Проверка, пора ли повторить поиск датчиков"""
+        return not self._sensors or time.monotonic() - self._last_scan >= self.rescan_interval
     
     def read_temp_raw(self, sensor_id):
         """Чтение сырых данных с датчика"""
-        device_file = self.base_dir + sensor_id + '/w1_slave'
+        # Файл temperature содержит готовое значение в тысячных долях градуса, CRC проверяет драйвер
+        device_file = self._device_files.get(sensor_id)
+        if device_file is None:
+            return ReadStatus.MISSING, None
+        
+        try:
+            # Файл короткий и фиксированного формата - читаем байты одним вызовом, без текстового декодера
+            fd = os.open(device_file, os.O_RDONLY)
+            try:
+                data = os.read(fd, 128)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            if e.errno in (errno.ENOENT, errno.ENODEV):
+                # Датчик пропал с шины - убираем его из кэша до следующего поиска
+                self._device_files.pop(sensor_id, None)
+                return ReadStatus.MISSING, None
+            if e.errno in (errno.EIO, errno.EAGAIN, errno.EBUSY, errno.ETIMEDOUT):
+                # Драйвер не смог получить данные (например, ошибка CRC)
+                return ReadStatus.TRANSIENT, None
+            # Неожиданная ошибка одного датчика не должна останавливать опрос остальных (и всю программу);
+            # в лог пишем только при её появлении, а не каждый цикл
+            if self._sensor_errors.get(sensor_id) != e.errno:
+                self._sensor_errors[sensor_id] = e.errno
+                logging.error("Ошибка чтения датчика %s: %s", sensor_id, e)
+            return ReadStatus.FAILED, None
+        
+        if self._sensor_errors.pop(sensor_id, None) is not None:
+            logging.info("Датчик %s снова читается", sensor_id)
+        return ReadStatus.OK, data
+    
+    @staticmethod
+    def parse_temp(data):
+        """Преобразование сырых данных в градусы Цельсия"""
+        if not data:
+            return None
         
         try:
-            with open(device_file, 'r') as f:
-                lines = f.readlines()
-            return lines
-        except:
+            return int(data) / 1000.0
+        except ValueError:
             return None
     
-    def read_temp(self, sensor_id):
+    def read_temp_once(self, sensor_id):
+        """Однократное чтение температуры, возвращает (статус, температура)"""
+        status, data = self.read_temp_raw(sensor_id)
+        if status is not ReadStatus.OK:
+            return status, None
+        
+        temp_c = self.parse_temp(data)
+        if temp_c is None:
+            return ReadStatus.TRANSIENT, None
+        
+        return ReadStatus.OK, temp_c
+    
+    def read_temp(self, sensor_id, max_retries=3):
         """Чтение и преобразование температуры"""
-        lines = self.read_temp_raw(sensor_id)
+        for attempt in range(max_retries):
+            status, temp_c = self.read_temp_once(sensor_id)
+            if status is ReadStatus.OK:
+                return temp_c
+            if status is ReadStatus.FAILED:
+                return None
+            if status is ReadStatus.MISSING:
+                self._rescan_needed = True
+                return None
+            
+            # Каждое повторное чтение запускает новую конвертацию, поэтому повторяем только при сбое на шине
+            if attempt < max_retries - 1:
+                time.sleep(0.2)
         
-        if lines is None or len(lines) < 2:
-            return None, None
+        # Датчик мог быть заменён - проверим список
+        self._rescan_needed = True
+        return None
+    
+    def get_all_temperatures(self):
+        """Получение температур со всех датчиков"""
+        if self.rescan_due():
+            self.refresh_sensors()
         
-        # Проверяем, что данные валидны (CRC = YES)
-        while lines[0].strip()[-3:] != 'YES':
-            time.sleep(0.2)
-            lines = self.read_temp_raw(sensor_id)
-            if lines is None:
-                return None, None
+        sensors = self.sensors
+        if not sensors:
+            return {}
         
-        # Ищем позицию температуры в данных
-        equals_pos = lines[1].find('t=')
-        if equals_pos == -1:
-            return None, None
+        # Каждое чтение датчика ждёт конвертацию (~750 мс), поэтому опрашиваем датчики параллельно
+        with ThreadPoolExecutor(max_workers=len(sensors)) as executor:
+            temps = list(executor.map(self.read_temp, sensors))
         
-        # Извлекаем и преобразуем температуру
-        temp_string = lines[1][equals_pos+2:]
-        temp_c = float(temp_string) / 1000.0
+        # Датчик мог быть отключен или заменён - обновляем список
+        if self._rescan_needed:
+            self.refresh_sensors()
         
-        return temp_c
+        return {sensor_id: temp_c for sensor_id, temp_c in zip(sensors, temps) if temp_c is not None}
     
-    def get_all_temperatures(self):
-        """Получение температур со всех датчиков"""
-        sensors = self.find_sensors()
-        results = {}
+    async def read_temp_async(self, sensor_id, max_retries=3):
+        """Асинхронное чтение температуры (блокирующее чтение выполняется в отдельном потоке)"""
+        for attempt in range(max_retries):
+            status, temp_c = await asyncio.to_thread(self.read_temp_once, sensor_id)
+            if status is ReadStatus.OK:
+                return temp_c
+            if status is ReadStatus.FAILED:
+                return None
+            if status is ReadStatus.MISSING:
+                self._rescan_needed = True
+                return None
+            
+            # Пауза не блокирует цикл событий - остальные датчики продолжают опрашиваться
+            if attempt < max_retries - 1:
+                await asyncio.sleep(0.2)
+        
+        self._rescan_needed = True
+        return None
+    
+    async def get_all_temperatures_async(self):
+        """Асинхронное получение температур со всех датчиков (датчики опрашиваются параллельно)"""
+        if self.rescan_due():
+            await asyncio.to_thread(self.refresh_sensors)
+        
+        sensors = self.sensors
         
-        for sensor_id in sensors:
-            temp_c = self.read_temp(sensor_id)
-            if temp_c is not None:
-                results[sensor_id] = temp_c
+        temps = await asyncio.gather(*[self.read_temp_async(sensor_id) for sensor_id in sensors])
         
-        return results
+        if self._rescan_needed:
+            await asyncio.to_thread(self.refresh_sensors)
+        
+        return {sensor_id: temp_c for sensor_id, temp_c in zip(sensors, temps) if temp_c is not None}
 
-class ModbusRTUWriter:
-    def __init__(self, port, baudrate, parity, stopbits, bytesize, timeout, slave_address):
-        self.port = port
-        self.baudrate = baudrate
-        self.parity = parity
-        self.stopbits = stopbits
-        self.bytesize = bytesize
-        self.timeout = timeout
-        self.slave_address = slave_address
-        self.instrument = None
-        
-        self.connect()
-    
-    def connect(self):
-        """Подключение к Modbus устройству"""
-        try:
-            self.instrument = Instrument(
-                self.port, 
-                self.slave_address,
-                close_port_after_each_call=True
-            )
-            
-            # Настройка параметров связи
-            self.instrument.serial.baudrate = self.baudrate
-            self.instrument.serial.parity = self.parity
-            self.instrument.serial.stopbits = self.stopbits
-            self.instrument.serial.bytesize = self.bytesize
-            self.instrument.serial.timeout = self.timeout
-            
-            logging.info(f"Modbus RTU подключен к {self.port}")
-            
-        except Exception as e:
-            logging.error(f"Ошибка подключения к Modbus: {e}")
-            self.instrument = None
+async def ds18b20_loop(sensor_reader, modbus_writer, sensor_registers, interval=5):
+    """Цикл опроса датчиков DS18B20 и отправки температур по Modbus"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time()
+    
+    # Номер датчика - его позиция в списке найденных при запуске, а не среди успешно прочитанных,
+    # иначе при сбое чтения одного датчика значение соседнего попадёт в чужой регистр.
+    # Датчики, подключенные позже, получают следующие номера
+    sensor_numbers = {sensor_id: i for i, sensor_id in enumerate(sensor_reader.sensors)}
     
-    def write_temperature(self, register_address, temperature):
-        """Запись температуры в регистр Modbus"""
-        if self.instrument is None:
-            self.connect()
-            if self.instrument is None:
-                return False
+    while True:
+        # Получаем температуры со всех датчиков
+        temperatures = await sensor_reader.get_all_temperatures_async()
         
-        try:
-            # Преобразуем температуру в целое число (умножаем на 10 для сохранения одного знака после запятой)
-            temp_value = int(temperature * 10)
-            
-            # Записываем значение в регистр
-            self.instrument.write_register(register_address, temp_value, functioncode=6)
-            
-            logging.info(f"Записано в регистр {register_address}: {temperature:.1f}°C")
-            return True
-            
-        except Exception as e:
-            logging.error(f"Ошибка записи в Modbus: {e}")
-            self.instrument = None
-            return False
+        current_time = time.strftime("%Y-%m-%d %H:%M:%S")
+        print(f"\nВремя: {current_time}")
+        
+        # Распределяем датчики по регистрам
+        writes = []
+        for sensor_id, temp_c in temperatures.items():
+            i = sensor_numbers.setdefault(sensor_id, len(sensor_numbers))
+            if i in sensor_registers:
+                writes.append((i, sensor_id, temp_c, sensor_registers[i]))
+            else:
+                print(f"Датчик {i} ({sensor_id}): {temp_c:.2f}°C (нет регистра)")
+        
+        # Группируем подряд идущие регистры, чтобы записать каждую группу одной транзакцией
+        writes.sort(key=lambda write: write[3])
+        runs = []
+        for write in writes:
+            if runs and write[3] == runs[-1][-1][3] + 1:
+                runs[-1].append(write)
+            else:
+                runs.append([write])
+        
+        # Отправляем температуры по Modbus
+        tasks = [
+            asyncio.create_task(modbus_writer.write_temperatures_async(run[0][3], [temp_c for _, _, temp_c, _ in run]))
+            for run in runs
+        ]
+        results = await asyncio.gather(*tasks)
+        
+        for run, success in zip(runs, results):
+            status = "✓" if success else "✗"
+            for i, sensor_id, temp_c, register in run:
+                print(f"Датчик {i} ({sensor_id}): {temp_c:.2f}°C -> регистр {register} {status}")
+        
+        # Пауза до следующего измерения по расписанию - время работы цикла не накапливается
+        deadline = await sleep_until_next(loop, deadline, interval)
 
-def main():
+async def main():
     # Настройка логирования
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('temperature_monitor.log'),
-            logging.StreamHandler()
-        ]
-    )
+    setup_logging('temperature_monitor.log')
     
     # Конфигурация Modbus RTU
     modbus_config = {
@@ -167,11 +292,12 @@ def main():
     
     print("Поиск датчиков DS18B20...")
     
-    # Ищем все датчики
-    sensors = sensor_reader.find_sensors()
+    # Датчики найдены при создании DS18B20
+    sensors = sensor_reader.sensors
     
     if not sensors:
         print("Датчики не найдены! Проверьте подключение.")
+        modbus_writer.close()
         return
     
     print(f"Найдено датчиков: {len(sensors)}")
@@ -183,33 +309,17 @@ def main():
     print("-" * 60)
     
     try:
-        while True:
-            # Получаем температуры со всех датчиков
-            temperatures = sensor_reader.get_all_temperatures()
-            
-            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"\nВремя: {current_time}")
-            
-            # Отправляем температуры по Modbus
-            for i, (sensor_id, temp_c) in enumerate(temperatures.items()):
-                if i < len(sensor_registers):
-                    register = sensor_registers[i]
-                    success = modbus_writer.write_temperature(register, temp_c)
-                    
-                    status = "✓" if success else "✗"
-                    print(f"Датчик {i} ({sensor_id}): {temp_c:.2f}°C -> регистр {register} {status}")
-                else:
-                    print(f"Датчик {i} ({sensor_id}): {temp_c:.2f}°C (нет регистра)")
-            
-            time.sleep(5)  # Пауза между измерениями (5 секунд)
-            
-    except KeyboardInterrupt:
-        print("\n\nРабота остановлена пользователем")
-        logging.info("Программа остановлена пользователем")
+        await ds18b20_loop(sensor_reader, modbus_writer, sensor_registers, interval=5)
     except Exception as e:
         print(f"\nПроизошла ошибка: {e}")
-        logging.error(f"Критическая ошибка: {e}")
+        logging.error("Критическая ошибка: %s", e)
+    finally:
+        modbus_writer.close()
 
 if __name__ == "__main__":
     # Установите минимальную версию minimalmodbus: pip install minimalmodbus
-    main()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n\nРабота остановлена пользователем")
+        logging.info("Программа остановлена пользователем")
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import struct
+import queue
+import atexit
+import asyncio
+import logging
+import logging.handlers
+from array import array
+import serial
+from minimalmodbus import Instrument, InvalidResponseError, NoResponseError, SlaveReportedException
+
+def _make_crc16_table():
+    """Таблица CRC16 Modbus (полином 0xA001) на все 256 значений байта"""
+    table = array('H')
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+_CRC16_TABLE = _make_crc16_table()
+
+# Шаблоны кадров: адрес устройства, код функции, регистр, значение / CRC (младший байт первым)
+# (значение - знаковое 16-битное, отрицательные температуры уходят в дополнительном коде)
+_WRITE_REGISTER_FRAME = struct.Struct('>BBHh')
+_CRC_FRAME = struct.Struct('<H')
+
+# Ответ на запись регистров (функции 6 и 16) всегда 8 байт
+_WRITE_RESPONSE_LENGTH = 8
+
+def to_register_values(temperatures):
+    """Перевод температур в значения регистров"""
+    # Умножаем на 10 для сохранения одного знака после запятой и ограничиваем диапазоном int16
+    return [max(-32768, min(32767, int(temperature * 10))) for temperature in temperatures]
+
+def _crc16(data):
+    """Расчёт CRC16 Modbus по таблице"""
+    crc = 0xFFFF
+    for byte in data:
+        crc = (crc >> 8) ^ _CRC16_TABLE[(crc ^ byte) & 0xFF]
+    return crc
+
+def setup_logging(filename):
+    """Настройка логирования в файл и консоль"""
+    # Запись выполняется в отдельном потоке, чтобы не блокировать цикл событий
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(
+        log_queue,
+        logging.FileHandler(filename),
+        logging.StreamHandler()
+    )
+    listener.start()
+    # Останавливаем при выходе, чтобы сообщения после asyncio.run() тоже попали в лог
+    atexit.register(listener.stop)
+    
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.handlers.QueueHandler(log_queue)]
+    )
+
+async def sleep_until_next(loop, deadline, interval):
+    """Пауза до следующего запуска по фиксированному расписанию, возвращает новый срок"""
+    # Срок отсчитывается от предыдущего, поэтому время работы цикла не накапливается
+    deadline += interval
+    now = loop.time()
+    if deadline < now:
+        # Цикл занял больше интервала - пропускаем опоздавшие запуски, сохраняя фазу
+        deadline += (now - deadline) // interval * interval + interval
+    await asyncio.sleep(deadline - now)
+    return deadline
+
+class ModbusRTUWriter:
+    def __init__(self, port, baudrate, parity, stopbits, bytesize, timeout, slave_address):
+        self.port = port
+        self.baudrate = baudrate
+        self.parity = parity
+        self.stopbits = stopbits
+        self.bytesize = bytesize
+        self.timeout = timeout
+        self.slave_address = slave_address
+        self.instrument = None
+        
+        # Пауза между кадрами Modbus RTU - 3.5 символа по 11 бит
+        self._silent_period = 3.5 * 11 / baudrate
+        self._last_transaction = 0.0
+        
+        # Блокировка шины: транзакции на одном последовательном порту не должны пересекаться
+        self._bus_lock = asyncio.Lock()
+        
+        self.connect()
+    
+    def connect(self):
+        """Подключение к Modbus устройству"""
+        try:
+            self.instrument = Instrument(
+                self.port, 
+                self.slave_address,
+                close_port_after_each_call=False
+            )
+            
+            # Настройка параметров связи
+            self.instrument.serial.baudrate = self.baudrate
+            self.instrument.serial.parity = self.parity
+            self.instrument.serial.stopbits = self.stopbits
+            self.instrument.serial.bytesize = self.bytesize
+            self.instrument.serial.timeout = self.timeout
+            # Пауза между байтами дольше интервала кадра означает конец ответа - read() вернётся сразу
+            self.instrument.serial.inter_byte_timeout = self._silent_period
+            
+            logging.info("Modbus RTU подключен к %s", self.port)
+            
+        except Exception as e:
+            logging.error("Ошибка подключения к Modbus: %s", e)
+            self.instrument = None
+    
+    def close(self):
+        """Закрытие последовательного порта"""
+        if self.instrument is not None:
+            self.instrument.serial.close()
+            self.instrument = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _transaction(self, request):
+        """Отправка кадра записи и проверка ответа устройства"""
+        # Выдерживаем паузу после предыдущего кадра, иначе устройство склеит кадры
+        remaining = self._last_transaction + self._silent_period - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        
+        # Кадр собирается целиком и уходит одним write() с одним flush()
+        frame = request + _CRC_FRAME.pack(_crc16(request))
+        
+        port = self.instrument.serial
+        port.reset_input_buffer()  # Остатки прошлого ответа не должны попасть в новый
+        port.write(frame)
+        port.flush()
+        response = self._read_response(port, _WRITE_RESPONSE_LENGTH)
+        self._last_transaction = time.monotonic()
+        
+        if not response:
+            raise NoResponseError("Нет ответа от устройства")
+        if len(response) < 5 or _crc16(response[:-2]) != _CRC_FRAME.unpack(response[-2:])[0]:
+            raise InvalidResponseError(f"Повреждённый ответ: {response.hex()}")
+        if response[1] == request[1] | 0x80:
+            raise SlaveReportedException(f"Устройство вернуло код ошибки {response[2]}")
+        # Ответ повторяет адрес, функцию, регистр и значение (количество регистров для функции 16)
+        if response[:6] != request[:6]:
+            raise InvalidResponseError(f"Неожиданный ответ: {response.hex()}")
+    
+    @staticmethod
+    def _read_response(port, expected_length):
+        """Чтение ответа целым кадром"""
+        # Один вызов read() забирает из буфера весь кадр, а не побайтно
+        response = port.read(expected_length)
+        
+        # Ответ с ошибкой короче (5 байт); в остальных случаях дочитываем остаток,
+        # если преобразователь USB/RS485 передал кадр частями
+        while 0 < len(response) < expected_length and not (len(response) >= 5 and response[1] & 0x80):
+            chunk = port.read(expected_length - len(response))
+            if not chunk:
+                break
+            response += chunk
+        
+        return response
+    
+    def write_temperature(self, register_address, temperature):
+        """Запись температуры в регистр Modbus"""
+        if self.instrument is None:
+            self.connect()
+            if self.instrument is None:
+                return False
+        
+        try:
+            # Преобразуем температуру в целое число
+            temp_value, = to_register_values((temperature,))
+            
+            # Записываем значение в регистр (функция 6)
+            self._transaction(_WRITE_REGISTER_FRAME.pack(self.slave_address, 6, register_address, temp_value))
+            
+            logging.info("Записано в регистр %d: %.1f°C", register_address, temperature)
+            return True
+            
+        except serial.SerialException as e:
+            # Порт недоступен - закрываем его, при следующей записи переподключимся
+            logging.error("Ошибка последовательного порта: %s", e)
+            self.close()
+            return False
+        except Exception as e:
+            logging.error("Ошибка записи в Modbus: %s", e)
+            return False
+    
+    def write_temperatures(self, start_register, temperatures):
+        """Запись нескольких температур в подряд идущие регистры одной транзакцией (функция 16)"""
+        if self.instrument is None:
+            self.connect()
+            if self.instrument is None:
+                return False
+        
+        try:
+            values = to_register_values(temperatures)
+            
+            count = len(values)
+            self._transaction(struct.pack(f'>BBHHB{count}h', self.slave_address, 16, start_register,
+                                          count, count * 2, *values))
+            
+            # Список значений собираем только если сообщение действительно попадёт в лог
+            if logging.getLogger().isEnabledFor(logging.INFO):
+                logging.info("Записано в регистры %d-%d: %s", start_register, start_register + count - 1,
+                             ", ".join(f"{temperature:.1f}°C" for temperature in temperatures))
+            return True
+            
+        except serial.SerialException as e:
+            # Порт недоступен - закрываем его, при следующей записи переподключимся
+            logging.error("Ошибка последовательного порта: %s", e)
+            self.close()
+            return False
+        except Exception as e:
+            logging.error("Ошибка записи в Modbus: %s", e)
+            return False
+    
+    async def write_temperature_async(self, register_address, temperature):
+        """Асинхронная запись температуры в регистр Modbus"""
+        async with self._bus_lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.write_temperature, register_address, temperature)
+    
+    async def write_temperatures_async(self, start_register, temperatures):
+        """Асинхронная запись нескольких температур в подряд идущие регистры"""
+        async with self._bus_lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.write_temperatures, start_register, temperatures)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+from modbus_writer import ModbusRTUWriter, setup_logging
+from ds18b20_modbus import DS18B20, ds18b20_loop
+from weather_modbus import WeatherFetcher, weather_loop
+
+async def main():
+    # Настройка логирования
+    setup_logging('plc_data_transfer.log')
+    
+    # Конфигурация Modbus RTU
+    modbus_config = {
+        "port": "/dev/ttyUSB0",
+        "baudrate": 9600,
+        "parity": 'E',
+        "stopbits": 1,
+        "bytesize": 8,
+        "timeout": 2,
+        "slave_address": 1
+    }
+    
+    # Регистры для датчиков
+    sensor_registers = {
+        0: 4096,  # Первый датчик
+        1: 4097   # Второй датчик
+    }
+    
+    # Регистр для записи температуры погоды (не должен совпадать с регистрами датчиков)
+    WEATHER_REGISTER = 4098
+    
+    # Один порт на оба цикла: транзакции на шине разделяет блокировка внутри ModbusRTUWriter
+    sensor_reader = DS18B20()
+    weather_fetcher = WeatherFetcher("Kurgan")
+    modbus_writer = ModbusRTUWriter(**modbus_config)
+    
+    sensors = sensor_reader.sensors
+    
+    print("Сервис передачи данных в ПЛК по Modbus RTU")
+    print(f"Найдено датчиков: {len(sensors)}")
+    
+    for i, sensor_id in enumerate(sensors):
+        print(f"Датчик {i}: {sensor_id} -> регистр {sensor_registers.get(i, 'N/A')}")
+    
+    print(f"Погода: Курган -> регистр {WEATHER_REGISTER}")
+    print("\nНачинаем работу (Ctrl+C для остановки):")
+    print("-" * 60)
+    
+    if not sensors:
+        print("Датчики не найдены! Поиск продолжится во время работы.")
+    
+    try:
+        # При ошибке в одном цикле TaskGroup отменяет второй и дожидается его завершения,
+        # поэтому порт и HTTP-сессия закрываются, когда ими уже никто не пользуется (Python 3.11+)
+        async with asyncio.TaskGroup() as tasks:
+            tasks.create_task(weather_loop(weather_fetcher, modbus_writer, WEATHER_REGISTER, interval=300))
+            tasks.create_task(ds18b20_loop(sensor_reader, modbus_writer, sensor_registers, interval=5))
+    except* Exception as errors:
+        for e in errors.exceptions:
+            print(f"\nПроизошла ошибка: {e}")
+            logging.error("Критическая ошибка: %s", e)
+    finally:
+        modbus_writer.close()
+        await weather_fetcher.close()
+
+if __name__ == "__main__":
+    # Установите необходимые библиотеки: pip install minimalmodbus aiohttp
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n\nРабота остановлена пользователем")
+        logging.info("Программа остановлена пользователем")
@@ -2,106 +2,147 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
 import time
-import datetime
+import asyncio
 import logging
-import requests
-from minimalmodbus import Instrument
+import aiohttp
+from modbus_writer import ModbusRTUWriter, setup_logging, sleep_until_next
+
+# Температура из блока current_condition ответа wttr.in (format=j1)
+TEMP_C_PATTERN = re.compile(rb'"temp_C"\s*:\s*"(-?\d+)"')
+
+# Задержка повторных запросов после ошибок считается в циклах опроса: после k-й ошибки подряд
+# пропускаем 2**k - 1 циклов (1, 3, 7, ...), но не больше MAX_SKIPPED_POLLS
+MAX_SKIPPED_POLLS = 7
 
 class WeatherFetcher:
-    def __init__(self, city="Kurgan"):
+    def __init__(self, city="Kurgan", verbose=False, cache_polls=1):
         self.city = city
         self.base_url = "https://wttr.in"
+        self.verbose = verbose
+        
+        if verbose:
+            # Полный JSON с прогнозом (несколько КБ)
+            self.url = f"{self.base_url}/{self.city}?format=j1"
+        else:
+            # Только текущая температура в виде "+12°C" (m - метрическая система)
+            self.url = f"{self.base_url}/{self.city}?format=%t&m"
+        
+        # Одна сессия на всё время работы: соединение с wttr.in переиспользуется (keep-alive)
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        
+        # Валидаторы кэша из последнего ответа (для ответа 304 без тела)
+        self._etag = None
+        self._last_modified = None
+        self._last_temperature = None
+        
+        # wttr.in обновляет данные не чаще раза в час - полученное значение отдаём из кэша
+        # следующим cache_polls вызовам (при опросе раз в 5 минут запрос идёт раз в 10 минут)
+        self.cache_polls = cache_polls
+        self._cached_polls_left = 0
+        
+        # Экспоненциальная задержка повторных запросов после ошибок (в циклах опроса)
+        self._failures = 0
+        self._skipped_polls_left = 0
+    
+    def _schedule_retry(self):
+        """Увеличение задержки перед следующим запросом после ошибки"""
+        self._failures += 1
+        self._skipped_polls_left = min(2 ** self._failures - 1, MAX_SKIPPED_POLLS)
     
-    def get_current_temperature(self):
+    def _remember(self, temperature):
+        """Сохранение полученного значения в кэш"""
+        self._last_temperature = temperature
+        self._cached_polls_left = self.cache_polls
+        self._failures = 0
+        return temperature
+    
+    async def get_current_temperature(self):
         """Получение текущей температуры из wttr.in"""
+        if self._cached_polls_left > 0:
+            self._cached_polls_left -= 1
+            logging.info("Температура из кэша: %s°C", self._last_temperature)
+            return self._last_temperature
+        
+        # После ошибки не обращаемся к wttr.in, пока не пройдёт задержка
+        if self._skipped_polls_left > 0:
+            self._skipped_polls_left -= 1
+            logging.info("Повторный запрос к wttr.in через %d цикл(а) опроса", self._skipped_polls_left + 1)
+            return None
+        
         try:
-            # Получаем данные в JSON формате
-            url = f"{self.base_url}/{self.city}?format=j1"
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
+            headers = {}
+            if self._etag:
+                headers['If-None-Match'] = self._etag
+            if self._last_modified:
+                headers['If-Modified-Since'] = self._last_modified
             
-            # Парсим температуру
-            data = response.json()
-            temperature = float(data['current_condition'][0]['temp_C'])
+            async with self.session.get(self.url, headers=headers) as response:
+                # Данные не изменились - используем последнее значение
+                if response.status == 304 and self._last_temperature is not None:
+                    logging.info("Данные wttr.in не изменились: %s°C", self._last_temperature)
+                    return self._remember(self._last_temperature)
+                
+                response.raise_for_status()
+                
+                # Парсим температуру
+                body = await response.read()
+                if self.verbose:
+                    # Из всего документа нужно одно поле, поэтому JSON целиком не разбираем
+                    match = TEMP_C_PATTERN.search(body)
+                    if match is None:
+                        raise ValueError("в ответе нет поля temp_C")
+                    temperature = float(match.group(1))
+                else:
+                    text = body.decode('utf-8').strip()
+                    temperature = float(text.rstrip('°C').lstrip('+'))
+                
+                self._etag = response.headers.get('ETag')
+                self._last_modified = response.headers.get('Last-Modified')
             
-            logging.info(f"Получена температура из wttr.in: {temperature}°C")
-            return temperature
+            logging.info("Получена температура из wttr.in: %s°C", temperature)
+            return self._remember(temperature)
             
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Ошибка получения данных с wttr.in: {e}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error("Ошибка получения данных с wttr.in: %s", e)
+            self._schedule_retry()
             return None
-        except (KeyError, ValueError, TypeError) as e:
-            logging.error(f"Ошибка парсинга данных: {e}")
+        except ValueError as e:
+            logging.error("Ошибка парсинга данных: %s", e)
+            self._schedule_retry()
             return None
-
-class ModbusRTUWriter:
-    def __init__(self, port, baudrate, parity, stopbits, bytesize, timeout, slave_address):
-        self.port = port
-        self.baudrate = baudrate
-        self.parity = parity
-        self.stopbits = stopbits
-        self.bytesize = bytesize
-        self.timeout = timeout
-        self.slave_address = slave_address
-        self.instrument = None
-        
-        self.connect()
     
-    def connect(self):
-        """Подключение к Modbus устройству"""
-        try:
-            self.instrument = Instrument(
-                self.port, 
-                self.slave_address,
-                close_port_after_each_call=True
-            )
-            
-            # Настройка параметров связи
-            self.instrument.serial.baudrate = self.baudrate
-            self.instrument.serial.parity = self.parity
-            self.instrument.serial.stopbits = self.stopbits
-            self.instrument.serial.bytesize = self.bytesize
-            self.instrument.serial.timeout = self.timeout
-            
-            logging.info(f"Modbus RTU подключен к {self.port}")
-            
-        except Exception as e:
-            logging.error(f"Ошибка подключения к Modbus: {e}")
-            self.instrument = None
+    async def close(self):
+        """Закрытие HTTP-сессии"""
+        await self.session.close()
+
+async def weather_loop(weather_fetcher, modbus_writer, register, interval=300):
+    """Цикл получения погоды и отправки температуры по Modbus"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time()
     
-    def write_temperature(self, register_address, temperature):
-        """Запись температуры в регистр Modbus"""
-        if self.instrument is None:
-            self.connect()
-            if self.instrument is None:
-                return False
+    while True:
+        # Получаем текущую температуру
+        temperature = await weather_fetcher.get_current_temperature()
         
-        try:
-            # Преобразуем температуру в целое число (умножаем на 10 для сохранения одного знака после запятой)
-            temp_value = int(temperature * 10)
-            
-            # Записываем значение в регистр
-            self.instrument.write_register(register_address, temp_value, functioncode=6)
-            
-            logging.info(f"Записано в регистр {register_address}: {temperature:.1f}°C")
-            return True
+        current_time = time.strftime("%Y-%m-%d %H:%M:%S")
+        
+        if temperature is not None:
+            # Отправляем температуру по Modbus
+            success = await modbus_writer.write_temperature_async(register, temperature)
             
-        except Exception as e:
-            logging.error(f"Ошибка записи в Modbus: {e}")
-            self.instrument = None
-            return False
+            status = "✓" if success else "✗"
+            print(f"{current_time} - Температура: {temperature:.1f}°C -> регистр {register} {status}")
+        else:
+            print(f"{current_time} - Не удалось получить температуру")
+        
+        # Пауза до следующего измерения по расписанию (по умолчанию 5 минут = 300 секунд)
+        deadline = await sleep_until_next(loop, deadline, interval)
 
-def main():
+async def main():
     # Настройка логирования
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('weather_modbus.log'),
-            logging.StreamHandler()
-        ]
-    )
+    setup_logging('weather_modbus.log')
     
     # Конфигурация Modbus RTU
     modbus_config = {
@@ -128,41 +169,28 @@ def main():
     print("-" * 60)
     
     try:
-        while True:
-            # Получаем текущую температуру
-            temperature = weather_fetcher.get_current_temperature()
-            
-            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            if temperature is not None:
-                # Отправляем температуру по Modbus
-                success = modbus_writer.write_temperature(WEATHER_REGISTER, temperature)
-                
-                status = "✓" if success else "✗"
-                print(f"{current_time} - Температура: {temperature:.1f}°C -> регистр {WEATHER_REGISTER} {status}")
-            else:
-                print(f"{current_time} - Не удалось получить температуру")
-            
-            # Пауза между измерениями (5 минут = 300 секунд)
-            time.sleep(300)
-            
-    except KeyboardInterrupt:
-        print("\n\nРабота остановлена пользователем")
-        logging.info("Программа остановлена пользователем")
+        await weather_loop(weather_fetcher, modbus_writer, WEATHER_REGISTER, interval=300)
     except Exception as e:
         print(f"\nПроизошла ошибка: {e}")
-        logging.error(f"Критическая ошибка: {e}")
+        logging.error("Критическая ошибка: %s", e)
+    finally:
+        modbus_writer.close()
+        await weather_fetcher.close()
 
 if __name__ == "__main__":
     # Проверяем наличие необходимых библиотек
     try:
         import minimalmodbus
-        import requests
+        import aiohttp
     except ImportError as e:
         print(f"Ошибка: Не установлены необходимые библиотеки: {e}")
         print("Установите их командами:")
         print("pip install minimalmodbus")
-        print("pip install requests")
+        print("pip install aiohttp")
         exit(1)
     
-    main()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n\nРабота остановлена пользователем")
+        logging.info("Программа остановлена пользователем")